@@ -1,20 +1,42 @@
 from flask import Flask, render_template, request, jsonify
 import numpy as np
+import os
 import learning
 from train import predict
+from tokenizer import Tokenizer
 import vectorize
 from werkzeug.exceptions import BadRequest
 import json
 
 app = Flask(__name__)
 
+# taille du cache LRU texte -> tokens des vectorizers (textes répétés : retweets, réponses toutes faites...)
+TOKEN_CACHE_SIZE = 10000
+
 # --- Preprocess---
-def preprocess(text, vocab):
-    # text must be a list of sentence
+def preprocess(text, vectorizer):
+    # text is split into sentences, then only tokenized and looked up in the fitted vocab/idf
     #X = vectorize.BoW(corpus=text, vocabConnu=vocab).get_BoW_matrix()
-    X = vectorize.TF_IDF(corpus=text, vocabConnu=vocab).compute_tf_idf_matrix()
+    X = vectorizer.transform(text)
     return X
 
+def load_vectorizer(model_path, vocab):
+    # the vectorizer is saved next to the model: <model>_hashing.json (config only, no vocab)
+    # or <model>_tfidf.json (vocab + idf)
+    hashing_path = model_path.replace(".json", "_hashing.json")
+    tokenizer = Tokenizer(cache_size=TOKEN_CACHE_SIZE)
+    if os.path.exists(hashing_path):
+        return vectorize.HashingVectorizer(tokenizer=tokenizer).load(hashing_path)
+
+    vectorizer_path = model_path.replace(".json", "_tfidf.json")
+    if os.path.exists(vectorizer_path):
+        return vectorize.TF_IDF(tokenizer=tokenizer).load(vectorizer_path)
+
+    # older model files only have the vocab: fall back to a neutral idf
+    vectorizer = vectorize.TF_IDF(vocabConnu=vocab, tokenizer=tokenizer)
+    vectorizer.idf_ = np.ones(len(vocab))
+    return vectorizer
+
 # def load_model_from_json(path, model_type):
 #     with open(path, "r") as f:
 #         params = json.load(f)
@@ -44,17 +66,34 @@ def index():
 
 
 model = None   # pas fixé au démarrage
+vectorizer = None
+loaded_models = {}  # choix -> (model, vectorizer), chargés une seule fois
 @app.route("/set_model", methods=["POST"])
 def set_model():
     global model
-    global vocab
+    global vectorizer
     choice = request.form.get("model")
-    if choice == "logistic":
-        model = learning.LogisticRegression()
-        vocab = model.load("LogisticRegressionFR.json")   # charge les paramètres et retourne le vocabulaires associé
-    elif choice == "naive_bayes":
-        model = learning.GaussianNB()
-        vocab = model.load("GaussianNBfr.json")
+    if choice not in loaded_models:
+        if choice == "logistic":
+            model_path = "LogisticRegressionFR.json"
+            new_model = learning.LogisticRegression()
+        elif choice == "naive_bayes":
+            model_path = "GaussianNBfr.json"
+            new_model = learning.GaussianNB()
+        else:
+            return jsonify({"error": "modèle inconnu"}), 400
+        vocab = new_model.load(model_path)   # charge les paramètres et retourne le vocabulaires associé
+        loaded_models[choice] = (new_model, load_vectorizer(model_path, vocab))
+    model, vectorizer = loaded_models[choice]
+    return jsonify({"model": choice})
+
+
+@app.route("/cache_info")
+def cache_info():
+    # hits / misses du cache de tokens du modèle courant
+    if vectorizer is None:
+        return jsonify({"error": "Aucun modèle sélectionné. Choisissez un modèle d'abord."}), 400
+    return jsonify(vectorizer.tokenizer.cache_info())
 
 
 SENTIMENT = {
@@ -66,7 +105,7 @@ SENTIMENT = {
 @app.route("/predict", methods=["POST"])
 def predict():
 
-    if model is None or vocab is None:
+    if model is None or vectorizer is None:
         return jsonify({"error": "Aucun modèle sélectionné. Choisissez un modèle d'abord."}), 400
 
     # 1. vérifier que c'est du json
@@ -87,7 +126,7 @@ def predict():
 
     # 3. préprocessing ---> features + probas
     try:
-        X = preprocess(comment, vocab)
+        X = preprocess(comment, vectorizer)
         probas = model.predict_proba(X)
         preds = [int(np.argmax(p)) for p in probas]
     except Exception as e:
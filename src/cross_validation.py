@@ -0,0 +1,103 @@
+# K-fold cross-validation of the learning models, the folds are trained in parallel processes.
+# Folds are only index arrays: X is written once and memory-mapped by the workers (see sweep.py),
+# each worker gathers the rows of its own fold (train + test rows, about the size of X), so the
+# peak memory is about n_jobs copies of X on top of the shared file: n_jobs bounds it, not n_splits.
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import scipy.sparse as sp
+from tqdm import tqdm
+import load_data
+import sweep
+import vectorize
+
+METRICS = ("accuracy", "precision", "recall", "f1")
+
+
+def stratified_kfold(y, n_splits=5, shuffle=True, seed=42):
+    """
+        assign each sample to one of n_splits folds, keeping the class proportions in every fold
+        return fold_of (n_samples,): fold_of[i] is the fold where sample i is used for testing
+    """
+    y = np.asarray(y)
+    rng = np.random.RandomState(seed)
+    fold_of = np.empty(len(y), dtype=np.int32)
+    offset = 0
+    for c in np.unique(y):
+        idx = np.flatnonzero(y == c)
+        if shuffle:
+            idx = rng.permutation(idx)
+        # round robin over the folds, continued from one class to the next so the fold sizes stay balanced
+        fold_of[idx] = (offset + np.arange(len(idx))) % n_splits
+        offset += len(idx)
+    return fold_of
+
+
+def kfold_indices(fold_of, fold):
+    # (train_idx, test_idx) of one fold, sorted so the rows of a CSR matrix are gathered in memory order
+    return np.flatnonzero(fold_of != fold), np.flatnonzero(fold_of == fold)
+
+
+def run_fold(fold, config, shared):
+    # worker: train on every fold but one and evaluate on the remaining one
+    X = sweep.open_matrix(shared["X"])
+    y = shared["y"]
+    train_idx, test_idx = kfold_indices(shared["fold_of"], fold)
+    result = sweep.fit_evaluate(config, X[train_idx], y[train_idx], X[test_idx], y[test_idx])
+    result["fold"] = fold
+    return result
+
+
+def cross_validate(X, y, config=None, n_splits=5, n_jobs=2, seed=42, dtype=np.float32, tmp_dir=None, verbose=True):
+    """
+        stratified k-fold cross-validation of the model described by config (same format as the sweep
+        configurations, e.g {"model": "GaussianNB"} or {"learning_rate": 0.3, "batch_size": 256})
+        n_jobs: folds trained at the same time (-1 = all the cores, capped at n_splits), each one holds
+        its own copy of the fold rows: peak memory ~ n_jobs x the size of X
+        return the per fold results and the mean / std of each metric
+    """
+    config = config or {}
+    y = np.asarray(y)
+    fold_of = stratified_kfold(y, n_splits, seed=seed)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, n_splits)
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as directory:
+        shared = {"X": sweep.share_matrix(X, directory, "X", dtype), "y": y, "fold_of": fold_of}
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            folds = executor.map(partial(run_fold, config=config, shared=shared), range(n_splits))
+            folds = list(tqdm(folds, total=n_splits) if verbose else folds)
+
+    scores = {metric: np.array([result[metric] for result in folds], dtype=float) for metric in METRICS}
+    summary = {
+        "config": config,
+        "folds": folds,
+        "mean": {metric: values.mean() for metric, values in scores.items()},
+        "std": {metric: values.std() for metric, values in scores.items()},
+    }
+    if verbose:
+        print_summary(summary)
+    return summary
+
+
+def print_summary(summary):
+    print("=== {}-fold cross-validation: {} ===".format(len(summary["folds"]), summary["config"]))
+    for metric in METRICS:
+        print(f"{metric}: {summary['mean'][metric]:.4f} (+/- {summary['std'][metric]:.4f})")
+
+
+def main():
+    # cross-validation over all the labeled tweets (train + test of the cached split)
+    vectorizer, (X_train, y_train), (X_test, y_test) = load_data.load_cached_vectors(
+        vectorize.TF_IDF(), train_filepath="train_df.csv", test_filepath="val_df.csv")
+    X = sp.vstack([X_train, X_test], format="csr")
+    y = np.concatenate([np.asarray(y_train), np.asarray(y_test)])
+    cross_validate(X, y, {"learning_rate": 0.3, "batch_size": 256, "n_iter": 1000, "tol": 1e-5})
+    cross_validate(X, y, {"model": "GaussianNB"})
+
+
+if __name__ == "__main__":
+    main()
@@ -2,51 +2,122 @@
 # aka logistic regression(binary and multiclass); naives bayes; and a neural networks.
 import json
 import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import minimize
 from tqdm import tqdm
 
-def softmax(z):
+def softmax(z, out=None):
+    # out: optional float buffer (can be z itself) where the result is computed in place
     z = np.asarray(z)
+    if out is not None:
+        np.subtract(z, np.max(z, axis=-1, keepdims=True), out=out)
+        np.exp(out, out=out)
+        out /= np.sum(out, axis=-1, keepdims=True)
+        return out
     z = z - np.max(z, axis=-1, keepdims=True) 
     exp_z = np.exp(z)
     return exp_z / np.sum(exp_z, axis=-1, keepdims=True)
 
+def check_features(X, dtype=float):
+    # scipy sparse matrices stay sparse (CSR), anything else becomes a dense float array
+    # dtype=None keeps a float32 / float64 X as it is (no copy), anything else becomes float64
+    if dtype is None:
+        dtype = X.dtype if np.issubdtype(getattr(X, "dtype", np.dtype(object)), np.floating) else float
+    if sp.issparse(X):
+        return X.tocsr().astype(dtype, copy=False)
+    return np.asarray(X, dtype=dtype)
+
+def class_sums(X, class_idx, n_classes):
+    """
+        sum of the rows of each class (n_classes, n_features) in one matmul X.T @ Y, Y being the one hot
+        of the labels in the dtype of X: X.T is a free view and a float32 X is never converted to float64
+    """
+    Y = np.zeros((X.shape[0], n_classes), dtype=X.dtype)
+    Y[np.arange(X.shape[0]), class_idx] = 1
+    return np.asarray(X.T @ Y, dtype=float).T
+
+def batch_indices(n_samples, batch_size, rng=None):
+    # split the samples in mini-batches: contiguous slices, or shuffled index arrays when a rng is given
+    # (sorted inside each batch so that the rows of a CSR matrix are gathered in memory order)
+    order = rng.permutation(n_samples) if rng is not None else None
+    for start in range(0, n_samples, batch_size):
+        yield slice(start, start + batch_size) if order is None else np.sort(order[start:start + batch_size])
+
+# rows predicted at once by GaussianNB (bounds the float64 temporaries of a float32 X)
+PREDICT_BLOCK = 10000
+
 class LogisticRegression:
-    def __init__(self, learning_rate=0.01, n_iter=1000, verbose = False):
+    def __init__(self, learning_rate=0.01, n_iter=1000, verbose = False, batch_size=None, shuffle=True,
+                 lr_schedule="constant", decay=0.01, random_state=0, tol=None, patience=5, monitor_every=10,
+                 solver="gd", dtype=np.float32):
         self.learning_rate = learning_rate      # it's just the learning rate lol  
-        self.n_iter = n_iter
+        self.n_iter = n_iter                    # number of epochs (passes over the data)
         self.verbose = verbose
 
+        # mini-batch / stochastic gradient descent
+        # batch_size=None -> full batch gradient descent (one update per epoch), batch_size=1 -> SGD
+        self.batch_size = batch_size
+        self.shuffle = shuffle                  # reshuffle the samples at each epoch (mini-batches only)
+        self.lr_schedule = lr_schedule          # "constant", "invscaling" or "exponential"
+        self.decay = decay
+        self.random_state = random_state
+
+        # early stopping: every monitor_every epochs the loss (validation loss if validation data
+        # is given to fit) is checked, training stops after patience checks without a tol improvement
+        self.tol = tol                          # None -> always run the n_iter epochs
+        self.patience = patience
+        self.monitor_every = monitor_every
+
+        # "gd": (mini-batch) gradient descent, "lbfgs" / "newton-cg": scipy.optimize solvers on the
+        # same loss and analytic gradient (learning_rate, batch_size, patience are then not used,
+        # n_iter is the max number of solver iterations and tol is passed to the solver)
+        self.solver = solver
+
+        # float type of X, the parameters and the training buffers (float32 halves the memory traffic)
+        self.dtype = dtype
+
         self.weights = None  # (n_features, n_classes)
         self.bias = None     # (n_classes,)
         self.classes_ = None
         self.class_to_index_ = None
         self.loss_history_ = []
+        self.val_loss_history_ = []
+        self.n_iter_ = 0     # number of epochs actually run
         
     #-------------------------utils_functions-------------------------
     def one_hot(self, class_idx):
         # convert self.y to an (nxk) vector where k is the number of classes 
-        Y = np.zeros((self.n_samples, self.k))
-        Y[np.arange(self.n_samples), class_idx] = 1.0
+        n = len(class_idx)
+        Y = np.zeros((n, self.k), dtype=self.dtype)
+        Y[np.arange(n), class_idx] = 1.0
         return Y
 
 
     def initialize_parameters(self):
         # return random weights and bias
         np.random.seed(0) 
-        self.weights = 0.001 * np.random.randn(self.n_features, self.k)
-        self.bias = np.zeros(self.k)
+        self.weights = (0.001 * np.random.randn(self.n_features, self.k)).astype(self.dtype)
+        self.bias = np.zeros(self.k, dtype=self.dtype)
         
 
-    def forward_pass(self, X):
+    def forward_pass(self, X, out=None):
         """
             n = n_samples, d = n_features, k = n_classes
             compute y_hat
             X(nxd), W(dxk), bias(kx1)
             linear_pred = X * weights + bias    (nxk)
             y_hat = softmax(linear_pred)    (nxk)
+            out: optional (nxk) buffer reused for linear_pred and y_hat
         """
-        linear_pred = X @ self.weights + self.bias
-        return softmax(linear_pred)
+        if out is None:
+            # width from the weights: a loaded model has no k (no training data seen)
+            out = np.empty((X.shape[0], self.weights.shape[1]), dtype=np.result_type(X.dtype, self.weights.dtype))
+        if sp.issparse(X):
+            out[...] = X @ self.weights     # scipy sparse matmuls have no out=
+        else:
+            np.matmul(X, self.weights, out=out)
+        out += self.bias
+        return softmax(out, out=out)
     
 
     def compute_loss(self, Y_hat, Y_onehot):
@@ -56,33 +127,122 @@ class LogisticRegression:
         return ce
     
 
-    def backward_pass(self, X, y_onehot, y_hat):
+    def backward_pass(self, X, y_onehot, y_hat, learning_rate=None, out=None):
         """
             update the weights and bias
 
             X(nxd), W(dxk), bias(kx1), y_hat(nxk), y(kx1)
             X.T * (y_hat - y) ---> (dxk)
+            X can be the whole dataset or a mini-batch: the gradient is averaged over its n rows
+            out: optional (diff, dw, db) buffers reused instead of allocating new arrays
         """
-        diff = y_hat - y_onehot
-        dw = (1/self.n_samples) * np.dot(X.T, diff)      # W_gradient
-        db = (1/self.n_samples) * np.sum(diff, axis=0)                # bias_gradient
-        self.weights -= self.learning_rate * dw
-        self.bias -= self.learning_rate * db
+        if learning_rate is None:
+            learning_rate = self.learning_rate
+        n = X.shape[0]
+        diff, dw, db = out if out is not None else (np.empty_like(y_hat), np.empty_like(self.weights), np.empty_like(self.bias))
+        np.subtract(y_hat, y_onehot, out=diff)
+        if sp.issparse(X):
+            dw[...] = X.T @ diff      # W_gradient
+        else:
+            np.matmul(X.T, diff, out=dw)
+        np.sum(diff, axis=0, out=db)                # bias_gradient
+        dw *= learning_rate / n
+        db *= learning_rate / n
+        self.weights -= dw
+        self.bias -= db
+
+
+    def learning_rate_at(self, epoch):
+        # learning rate schedule, updated once per epoch
+        if self.lr_schedule == "constant":
+            return self.learning_rate
+        if self.lr_schedule == "invscaling":
+            return self.learning_rate / (1.0 + self.decay * epoch)
+        if self.lr_schedule == "exponential":
+            return self.learning_rate * (1.0 - self.decay) ** epoch
+        raise ValueError("unknown lr_schedule: {}".format(self.lr_schedule))
+
+
+    def set_parameters(self, theta):
+        # theta = [W.ravel(), bias], the flat parameter vector used by the scipy solvers
+        self.weights = theta[:-self.k].reshape(self.n_features, self.k)
+        self.bias = theta[-self.k:]
+
+
+    def loss_and_gradient(self, theta, X, y_onehot):
+        # cross-entropy and its analytic gradient (same as backward_pass) for the scipy solvers
+        self.set_parameters(theta)
+        y_hat = self.forward_pass(X)
+        diff = (y_hat - y_onehot) / X.shape[0]
+        gradient = np.concatenate([np.asarray(X.T @ diff).ravel(), np.sum(diff, axis=0)])
+        return self.compute_loss(y_hat, y_onehot), gradient
+
+
+    def hessian_product(self, theta, v, X, y_hat):
+        """
+            Hessian-vector product of the cross-entropy for newton-cg (the Hessian is never built)
+            V = direction for W (dxk), v_b = direction for the bias (k)
+            Z = X * V + v_b    (nxk)
+            R = y_hat * (Z - sum(y_hat * Z))    (nxk)
+            H.v = [X.T * R, sum(R)] / n
+        """
+        z = X @ v[:-self.k].reshape(self.n_features, self.k) + v[-self.k:]
+        r = y_hat * (z - np.sum(y_hat * z, axis=1, keepdims=True)) / X.shape[0]
+        return np.concatenate([np.asarray(X.T @ r).ravel(), np.sum(r, axis=0)])
+
+
+    def fit_optimize(self, X, y_onehot):
+        # train with scipy.optimize (solver="lbfgs" or "newton-cg") starting from the initial parameters
+        # the scipy solvers work in float64 whatever the dtype of X
+        theta0 = np.concatenate([self.weights.ravel(), self.bias]).astype(np.float64)
+        last = {}
+
+        def objective(theta):
+            loss, gradient = self.loss_and_gradient(theta, X, y_onehot)
+            last["loss"] = loss
+            return loss, gradient
+
+        def hessp(theta, v):
+            # newton-cg calls hessp many times at the same point: the softmax is computed once per point
+            if "theta" not in last or not np.array_equal(last["theta"], theta):
+                self.set_parameters(theta)
+                last["theta"], last["y_hat"] = theta.copy(), self.forward_pass(X)
+            return self.hessian_product(theta, v, X, last["y_hat"])
+
+        def callback(theta):
+            # monitoring: loss of the last evaluated point (the accepted one)
+            self.loss_history_.append(last["loss"])
+            iteration = len(self.loss_history_) - 1
+            if self.verbose and (iteration % max(1, self.n_iter // 10) == 0):
+                print(f"[{iteration:5d}] loss={last['loss']:.4f}")
+
+        if self.solver == "lbfgs":
+            result = minimize(objective, theta0, jac=True, method="L-BFGS-B", tol=self.tol,
+                              callback=callback, options={"maxiter": self.n_iter})
+        elif self.solver == "newton-cg":
+            result = minimize(objective, theta0, jac=True, hessp=hessp, method="Newton-CG", tol=self.tol,
+                              callback=callback, options={"maxiter": self.n_iter})
+        else:
+            raise ValueError("unknown solver: {}".format(self.solver))
+
+        self.set_parameters(result.x.copy())
+        self.n_iter_ = result.nit
+        self.loss_history_.append(result.fun)
 
     #-------------------------main---------------------------
-    def fit(self, X, y):
+    def fit(self, X, y, X_val=None, y_val=None):
         # fit the model to the given data points (i.e find goods parameters to make good prediction)
-        X = np.array(X)
+        # X can be a dense array or a scipy sparse matrix: sparse X stays CSR (never densified),
+        # forward/backward passes are sparse matmuls (X @ W and X.T @ diff, X.T being a free CSC view)
+        # X_val, y_val: optional validation set monitored for early stopping (see tol)
+        X = check_features(X, self.dtype)
         y = np.array(y)
         """for x, label in zip(X, y):
             print(f"({x}, {label})")"""             #-----------------------debug--------------
 
         # map y (the labels) to 0,1...k-1 values
-        self.classes = np.unique(y)
-        self.class_to_index = {c : i for i, c in enumerate(self.classes)}
+        self.set_classes(y)
         self.class_idx = np.vectorize(self.class_to_index.get)(y)
-
-        self.k = self.classes.size      # number of class
         
         self.n_samples, self.n_features = X.shape     # number of samples and features
 
@@ -90,25 +250,129 @@ class LogisticRegression:
         # but first initialize the weights and bias
         y_one_hot = self.one_hot(self.class_idx)
         self.initialize_parameters()
-        for iteration in tqdm(range(self.n_iter)):
-            # compute predictions for current parameters
-            y_hat = self.forward_pass(X)
-
-            # updates the parameters following gradient descent and repeat
-            self.backward_pass(X, y_one_hot, y_hat)
+        if self.solver != "gd":
+            self.fit_optimize(X, y_one_hot)
+            if self.verbose:
+                print(f"Training finished after {self.n_iter_} iterations. final loss={self.loss_history_[-1]:.6f}")
+            return
+        if X_val is not None:
+            X_val = check_features(X_val, self.dtype)
+            y_val_one_hot = self.one_hot(np.vectorize(self.class_to_index.get)(np.asarray(y_val)))
+        best_loss, best_params, no_improvement = np.inf, None, 0
+        rng = np.random.RandomState(self.random_state) if self.shuffle else None
+        buffers = self.allocate_buffers(self.n_samples)
+        for iteration in tqdm(range(self.n_iter), disable=not self.verbose):
+            learning_rate = self.learning_rate_at(iteration)
+            check = self.tol is not None and (iteration + 1) % self.monitor_every == 0
+            monitor = self.verbose or check or iteration == self.n_iter - 1
+            loss = self.run_epoch(X, y_one_hot, learning_rate, buffers, rng, monitor)
 
             # monitoring
-            if self.verbose or iteration == self.n_iter - 1:
-                loss = self.compute_loss(y_hat, y_one_hot)
+            if monitor:
                 self.loss_history_.append(loss)
                 if self.verbose and (iteration % max(1, self.n_iter // 10) == 0):
                     print(f"[{iteration:5d}] loss={loss:.4f}")
+            self.n_iter_ = iteration + 1
+
+            # early stopping
+            if check:
+                if X_val is not None:
+                    loss = self.compute_loss(self.forward_pass(X_val), y_val_one_hot)
+                    self.val_loss_history_.append(loss)
+                if loss < best_loss - self.tol:
+                    best_loss, no_improvement = loss, 0
+                    if X_val is not None:
+                        best_params = (self.weights.copy(), self.bias.copy())
+                else:
+                    no_improvement += 1
+                    if no_improvement >= self.patience:
+                        if self.verbose:
+                            print(f"[{iteration:5d}] no improvement for {self.patience} checks, stopping")
+                        break
+        # with a validation set, keep the parameters of the best validation loss
+        if best_params is not None:
+            self.weights, self.bias = best_params
         if self.verbose:
             print(f"Training finished. final loss={self.loss_history_[-1]:.6f}")
 
 
+    def partial_fit(self, X, y, classes=None):
+        """
+            one epoch of (mini-batch) gradient descent on a new batch of data, the parameters of the
+            previous calls are kept: training from a chunked reader or updating a model with new labels
+            classes: every label the model will ever see (required by the first call when a batch
+            may miss some of them), the first call initializes the parameters
+            (always gradient steps, whatever the solver)
+        """
+        X = check_features(X, self.dtype)
+        y = np.asarray(y)
+        first_call = self.weights is None
+        if first_call:
+            self.set_classes(y if classes is None else classes)
+        elif classes is not None and not np.array_equal(np.unique(classes), self.classes):
+            # the weights have one column per class: the classes can't change after the first call
+            raise ValueError("classes {} differ from the classes of the model {}".format(np.unique(classes), self.classes))
+        if first_call:
+            self.n_features = X.shape[1]
+            self.initialize_parameters()
+            self.rng_ = np.random.RandomState(self.random_state) if self.shuffle else None
+
+        unknown = ~np.isin(y, self.classes)
+        if unknown.any():
+            raise ValueError("unknown labels: {} (classes: {})".format(np.unique(y[unknown]), self.classes))
+        y_one_hot = self.one_hot(np.searchsorted(self.classes, y))
+
+        learning_rate = self.learning_rate_at(self.n_iter_)
+        loss = self.run_epoch(X, y_one_hot, learning_rate, self.allocate_buffers(X.shape[0]), getattr(self, "rng_", None), True)
+        self.loss_history_.append(loss)
+        self.n_iter_ += 1
+        return self
+
+
+    def set_classes(self, y):
+        # the sorted distinct labels and their index (column of the one hot / of the weights)
+        self.classes = np.unique(y)
+        self.class_to_index = {c : i for i, c in enumerate(self.classes)}
+        self.k = self.classes.size      # number of class
+
+
+    def allocate_buffers(self, n_samples):
+        # buffers allocated once and reused by every update (first rows only for a smaller last batch)
+        rows = n_samples if self.batch_size is None else min(self.batch_size, n_samples)
+        y_hat = np.empty((rows, self.k), dtype=self.dtype)
+        return y_hat, np.empty_like(y_hat), np.empty_like(self.weights), np.empty_like(self.bias)
+
+
+    def run_epoch(self, X, y_one_hot, learning_rate, buffers, rng=None, monitor=False):
+        """
+            one epoch: a single update on the whole data, or one update per mini-batch
+            (shuffled when a rng is given), return the mean loss of the epoch if monitor is True
+        """
+        n_samples = X.shape[0]
+        full_batch = self.batch_size is None or self.batch_size >= n_samples
+        y_hat_buffer, diff, dw, db = buffers
+        loss = 0.0
+
+        batches = [None] if full_batch else batch_indices(n_samples, self.batch_size, rng)
+        for batch in batches:
+            X_batch = X if batch is None else X[batch]
+            y_batch = y_one_hot if batch is None else y_one_hot[batch]
+            m = X_batch.shape[0]
+
+            # compute predictions for current parameters
+            y_hat = self.forward_pass(X_batch, out=y_hat_buffer[:m])
+
+            # updates the parameters following gradient descent and repeat
+            self.backward_pass(X_batch, y_batch, y_hat, learning_rate, out=(diff[:m], dw, db))
+
+            # the epoch loss is the mean of the mini-batch losses (weighted by their size)
+            if monitor:
+                loss += self.compute_loss(y_hat, y_batch) * m / n_samples
+        return loss
+
+
     def predict_proba(self, X):
-        X = np.asarray(X, dtype=float)
+        X = check_features(X, self.dtype)
         return self.forward_pass(X)
 
 
@@ -124,7 +388,7 @@ class LogisticRegression:
 
     def accuracy(self, X, y):
         # return the accuracy 
-        X = np.asarray(X, dtype=float)
+        X = check_features(X, self.dtype)
         y_pred = self.predict(X)
         return np.mean(y_pred == y)
 
@@ -133,6 +397,7 @@ class LogisticRegression:
       parameters = {
         "weights": self.weights.tolist(),
         "bias": self.bias.tolist(),
+        "classes": self.classes.tolist(),
         "vocab": vocab
       }
 
@@ -145,93 +410,142 @@ class LogisticRegression:
       with open(filepath, "r") as f:
           parameters = json.load(f)
 
-      self.weights = np.array(parameters["weights"])
-      self.bias = np.array(parameters["bias"])
+      self.weights = np.array(parameters["weights"], dtype=self.dtype)
+      self.bias = np.array(parameters["bias"], dtype=self.dtype)
+      # older files were saved without the classes (labels 0..k-1)
+      self.set_classes(parameters.get("classes", range(len(self.bias))))
+      self.n_features = self.weights.shape[0]
       return parameters["vocab"]
 
 
 class GaussianNB:
+    def __init__(self, var_smoothing=1e-9):
+        self.var_smoothing = var_smoothing     # added to every variance (avoid dividing by 0)
+        self.class_count_ = None                # number of samples seen for each class
 
     def fit(self, X, y):
-        # convert the set of examples to numpy nd arrays
-        self.X = np.asarray(X)
-        self.y = np.asarray(y)
-
-        # number of samples and features 
-        n_samples, n_features = self.X.shape
+        # convert the set of examples to numpy nd arrays (or CSR if X is sparse), float32 stays float32
+        X = check_features(X, None)
+        y = np.asarray(y)
 
-        # get the different classes in the dataset 
-        self.classes_ = np.unique(self.y)
-        n_classes = len(self.classes_)
-        
-        # initialize the mean, var and prior_proba for each class to zero
-        self.mean_ = np.zeros((n_classes, n_features), dtype=float)
-        self.var_ = np.zeros((n_classes, n_features), dtype=float)
-        self.priors_ = np.zeros(n_classes, dtype=float)
-
-        for idx, c in enumerate(self.classes_):
-            X_c = self.X[y==c]  # get all the samples where the label is equal to c 
-
-            # compute the mean, var and prior_proba for the class c at index idx
-            self.mean_[idx, :] = np.mean(X_c, axis=0)
-            self.var_[idx, :] = np.var(X_c, axis=0) + 1e-9
-            self.priors_[idx] = X_c.shape[0] / float(n_samples) # it's a simple frequence
+        # fitting from scratch is a single partial_fit on the whole data
+        self.class_count_ = None
+        self.mean_ = None
+        self.partial_fit(X, y, classes=np.unique(y))
         
         # compute the loss
-        self.log_loss(self.X, self.y)
+        self.log_loss(X, self.predict_proba(X), y)
+        return self
+
+    def partial_fit(self, X, y, classes=None):
+        """
+            update the mean, var and prior_proba of each class with a new batch of samples
+            (Chan et al. parallel mean / variance update), memory is bounded by the batch size
+            classes: every label the model will ever see, required by the first call when a batch
+            may miss some of them
+        """
+        X = check_features(X, None)
+        y = np.asarray(y)
+
+        # a model loaded from an older file has mean / var but not the class counts needed to merge
+        if self.class_count_ is None and getattr(self, "mean_", None) is not None:
+            raise ValueError("this model has no class counts (saved before partial_fit existed): "
+                             "refit it with fit() before updating it with partial_fit()")
+
+        # first call: initialize the mean, var and count of each class
+        if self.class_count_ is None:
+            self.classes_ = np.unique(y if classes is None else classes)
+            n_classes, n_features = len(self.classes_), X.shape[1]
+            self.mean_ = np.zeros((n_classes, n_features), dtype=float)
+            self.var_ = np.full((n_classes, n_features), self.var_smoothing, dtype=float)
+            self.class_count_ = np.zeros(n_classes, dtype=float)
+
+        unknown = ~np.isin(y, self.classes_)
+        if unknown.any():
+            raise ValueError("unknown labels: {} (classes: {})".format(np.unique(y[unknown]), self.classes_))
+
+        class_idx = np.searchsorted(self.classes_, y)
+        if sp.issparse(X):
+            # sums of x and x^2 of every class without gathering their rows (x^2 only squares the data array)
+            X_sq = sp.csr_matrix((X.data**2, X.indices, X.indptr), shape=X.shape)
+            sums, sums_sq = class_sums(X, class_idx, len(self.classes_)), class_sums(X_sq, class_idx, len(self.classes_))
+
+        for idx in np.unique(class_idx):
+            # mean and var of the class at index idx in the batch
+            # sparse: var = E[x^2] - E[x]^2 so that X never gets densified, dense: two-pass np.var (no cancellation)
+            n_new = np.count_nonzero(class_idx == idx)
+            if sp.issparse(X):
+                mean_new = sums[idx] / n_new
+                var_new = np.maximum(sums_sq[idx] / n_new - mean_new**2, 0)
+            else:
+                X_c = X[class_idx == idx]  # get all the samples of the batch of this class
+                mean_new = np.mean(X_c, axis=0, dtype=np.float64)
+                var_new = np.var(X_c, axis=0, dtype=np.float64)
+
+            # merge with the statistics of the previous batches
+            n_old = self.class_count_[idx]
+            n = n_old + n_new
+            delta = mean_new - self.mean_[idx]
+            var_old = self.var_[idx] - self.var_smoothing
+            self.mean_[idx, :] += delta * n_new / n
+            self.var_[idx, :] = (n_old * var_old + n_new * var_new + delta**2 * n_old * n_new / n) / n + self.var_smoothing
+            self.class_count_[idx] = n
+
+        self.priors_ = self.class_count_ / self.class_count_.sum() # it's a simple frequence
+        self.compute_terms_()
+        return self
+
+    def compute_terms_(self):
+        """
+            precompute the per class terms of the joint log likelihood (after fit / load)
+            log P(c) + sum_j log N(x_j; mean_cj, var_cj)
+              = log P(c) - 1/2 sum_j log(2 pi var_cj) - 1/2 sum_j mean_cj^2 / var_cj     (class_log_term_)
+                + x . (mean_c / var_c)                                                   (mean_inv_var_)
+                - 1/2 x^2 . (1 / var_c)                                                  (inv_var_)
+        """
+        self.inv_var_ = 1.0 / self.var_
+        self.mean_inv_var_ = self.mean_ * self.inv_var_
+        self.class_log_term_ = (np.log(self.priors_)
+                                - 0.5 * np.sum(np.log(2 * np.pi * self.var_), axis=1)
+                                - 0.5 * np.sum(self.mean_ * self.mean_inv_var_, axis=1))
+
+
+    def joint_log_likelihood(self, X):
+        # log P(c) + log P(x|c) of every sample for every class (n_samples, n_classes), two matmuls for the whole batch
+        X = check_features(X, None)
+        # the terms stay float64 (inverse variances up to 1 / var_smoothing): a float32 X is upcast
+        # by blocks of rows by the matmuls, never as a whole
+        if X.shape[0] > PREDICT_BLOCK:
+            return np.vstack([self.joint_log_likelihood(X[i:i + PREDICT_BLOCK]) for i in range(0, X.shape[0], PREDICT_BLOCK)])
+        X_sq = X.multiply(X) if sp.issparse(X) else X**2
+        jll = X @ self.mean_inv_var_.T - 0.5 * (X_sq @ self.inv_var_.T)
+        return np.asarray(jll) + self.class_log_term_
+
 
     def predict(self, X):
         # take a set of samples as input and output the label predicted for each sample
-        y_pred = [self.predict_onesample_(x, label=True) for x in X]
-        return np.array(y_pred)
+        return self.classes_[np.argmax(self.joint_log_likelihood(X), axis=1)]
     
 
     def predict_proba(self, X):
         # take a set of samples as input and output a proaba distribution for each sample
-        return np.array([self.predict_onesample_(x, distribution=True) for x in X])
+        return softmax(self.joint_log_likelihood(X))
     
 
-    def predict_onesample_(self, x, label=False, distribution=False):
-        # take one sample and return the label predicted 
-        posteriors = []
-
-        for idx, c in enumerate(self.classes_):
-            # compute posterior probability 
-            # posterior = prior + P(x|c) 
-            prior = np.log(self.priors_[idx])
-            posterior = prior + np.sum(self.log_normalPDF_(idx, x))
-            posteriors.append(posterior)
-
-        if label:
-            # return the class with the highest posterior 
-            return self.classes_[np.argmax(posteriors)]         #np.argmax(posteriors) give the idx of the class with the highest posterior
-        if distribution:
-            # return a probability distribution on the classes
-            return softmax(posteriors)
-
-
-    def log_normalPDF_(self, class_idx, x):
-        # use the normal formula on each feature of the sample x to compute its log
-        first_part = -(x - self.mean_[class_idx])**2 / (2 * self.var_[class_idx])
-        second_part = -1/2 * np.log(2 * np.pi * self.var_[class_idx])
-        log_pdf = first_part + second_part
-        return log_pdf
-    
     def log_loss(self, X, probs, y):
         # compute the log_loss of the model for the sake of comparaison with other
-        X = np.asarray(X)
         y = np.asarray(y)
 
         # proba distribution of the labels for each samples
         # probs is an 2d array of shape (n_samples, n_classes)
-        n_samples = X.shape[0]
+        n_samples = probs.shape[0]
 
         # avoid log(0)
         epsilon = 1e-12
-        np.clip(probs, epsilon, 1 - epsilon)
+        probs = np.clip(probs, epsilon, 1 - epsilon)
 
-        # get the prob P(y|x) for each real class y
-        class_probs = probs[np.arrage(n_samples), y]  # shape (n_samples, 1)
+        # get the prob P(y|x) for each real class y (labels mapped to their column in probs)
+        class_probs = probs[np.arange(n_samples), np.searchsorted(self.classes_, y)]  # shape (n_samples, 1)
 
         # compute log_loss 
         loss = -np.sum(np.log(class_probs)) / n_samples
@@ -247,7 +561,7 @@ class GaussianNB:
 
     def accuracy(self, X, y):
         # return the accuracy 
-        X = np.asarray(X, dtype=float)
+        X = check_features(X, None)
         y_pred = self.predict(X)
         return np.mean(y_pred == y)
 
@@ -256,9 +570,12 @@ class GaussianNB:
         "classes": self.classes_.tolist(),
         "mean": self.mean_.tolist(),
         "var": self.var_.tolist(),
-        "prios": self.priors_.tolist(),
+        "priors": self.priors_.tolist(),
         "vocab": vocab
       }
+      # a model loaded from an older file has no class counts
+      if self.class_count_ is not None:
+        parameters["class_count"] = self.class_count_.tolist()
 
       # save to a json file format
       with open("{}.json".format(filename), "w") as f:
@@ -268,8 +585,152 @@ class GaussianNB:
       with open(filepath, "r") as f:
           parameters = json.load(f)
 
-      self.classes_ = np.array(parameters["classes"])
+      # older files were saved with a "prios" key and without the classes (labels 0..k-1)
+      self.priors_ = np.array(parameters["priors"] if "priors" in parameters else parameters["prios"])
+      self.classes_ = np.array(parameters.get("classes", range(len(self.priors_))))
       self.mean_ = np.array(parameters["mean"])
       self.var_ = np.array(parameters["var"])
-      self.priors_ = np.array(parameters["priors"])
+      # without the class counts (older files) the model can predict but partial_fit refuses to update it
+      self.class_count_ = np.array(parameters["class_count"]) if "class_count" in parameters else None
+      self.compute_terms_()
+      return parameters["vocab"]
+
+
+class MultinomialNB:
+    """
+        naive bayes on counts / tf-idf weights (non negative sparse features, never densified)
+        training: the feature counts of each class in one sparse matmul Y.T @ X (Y = one hot of the labels)
+        prediction: one sparse matmul X @ log P(feature|class).T
+    """
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha                # additive (Laplace) smoothing of the feature counts
+        self.class_count_ = None          # number of samples seen for each class
+        self.feature_count_ = None        # (n_classes, n_features) summed features of each class
+
+    def fit(self, X, y):
+        X = check_features(X, None)
+        y = np.asarray(y)
+
+        # fitting from scratch is a single partial_fit on the whole data
+        self.class_count_ = None
+        self.partial_fit(X, y, classes=np.unique(y))
+
+        # compute the loss
+        self.log_loss(X, self.predict_proba(X), y)
+        return self
+
+    def partial_fit(self, X, y, classes=None):
+        # add the counts of a new batch of samples (classes: every label, required by the first call if a batch may miss some)
+        X = check_features(X, None)
+        y = np.asarray(y)
+        values = X.data if sp.issparse(X) else X
+        if values.size and values.min() < 0:
+            raise ValueError("MultinomialNB needs non negative features (counts, tf-idf...)")
+
+        # first call: initialize the counts
+        if self.class_count_ is None:
+            self.classes_ = np.unique(y if classes is None else classes)
+            self.class_count_ = np.zeros(len(self.classes_), dtype=float)
+            self.feature_count_ = np.zeros((len(self.classes_), X.shape[1]), dtype=float)
+
+        unknown = ~np.isin(y, self.classes_)
+        if unknown.any():
+            raise ValueError("unknown labels: {} (classes: {})".format(np.unique(y[unknown]), self.classes_))
+
+        # one matmul sums the rows of each class
+        class_idx = np.searchsorted(self.classes_, y)
+        self.feature_count_ += class_sums(X, class_idx, len(self.classes_))
+        self.class_count_ += np.bincount(class_idx, minlength=len(self.classes_))
+
+        self.compute_terms_()
+        return self
+
+    def compute_terms_(self):
+        # smoothed log P(feature|class) and log P(class) (after partial_fit / load)
+        smoothed = self.feature_count_ + self.alpha
+        self.feature_log_prob_ = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        self.class_log_prior_ = np.log(self.class_count_) - np.log(self.class_count_.sum())
+
+    def joint_log_likelihood(self, X):
+        # log P(c) + sum_j x_j log P(j|c) for the whole batch (n_samples, n_classes)
+        # (log probs cast to the dtype of X: a float32 X is not converted)
+        X = check_features(X, None)
+        return np.asarray(X @ self.feature_log_prob_.T.astype(X.dtype, copy=False)) + self.class_log_prior_
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.joint_log_likelihood(X), axis=1)]
+
+    def predict_proba(self, X):
+        return softmax(self.joint_log_likelihood(X))
+
+    # same log loss and accuracy as GaussianNB
+    log_loss = GaussianNB.log_loss
+    accuracy = GaussianNB.accuracy
+
+    def get_parameters_(self):
+      # the counts are saved (not the log probs) so that a loaded model can still be updated with partial_fit
+      return {
+        "classes": self.classes_.tolist(),
+        "alpha": self.alpha,
+        "class_count": self.class_count_.tolist(),
+        "feature_count": self.feature_count_.tolist(),
+      }
+
+    def set_parameters_(self, parameters):
+      self.classes_ = np.array(parameters["classes"])
+      self.alpha = parameters["alpha"]
+      self.class_count_ = np.array(parameters["class_count"])
+      self.feature_count_ = np.array(parameters["feature_count"])
+      self.compute_terms_()
+
+    def save(self, vocab, filename="MultinomialNB"):
+      parameters = self.get_parameters_()
+      parameters["vocab"] = vocab
+
+      # save to a json file format
+      with open("{}.json".format(filename), "w") as f:
+        json.dump(parameters, f)
+
+    def load(self, filepath="MultinomialNB.json"):
+      with open(filepath, "r") as f:
+          parameters = json.load(f)
+
+      self.set_parameters_(parameters)
       return parameters["vocab"]
+
+
+class ComplementNB(MultinomialNB):
+    """
+        complement naive bayes (Rennie et al. 2003): the weights of a class are estimated from the
+        counts of all the other classes, more stable than MultinomialNB on unbalanced text data
+    """
+    def __init__(self, alpha=1.0, norm=False):
+        super().__init__(alpha)
+        self.norm = norm                  # normalize the weights of each class (second step of the paper)
+
+    def compute_terms_(self):
+        complement = self.feature_count_.sum(axis=0) - self.feature_count_ + self.alpha
+        logged = np.log(complement) - np.log(complement.sum(axis=1, keepdims=True))
+        # a feature frequent in the other classes is evidence against the class
+        self.feature_log_prob_ = logged / logged.sum(axis=1, keepdims=True) if self.norm else -logged
+        self.class_log_prior_ = np.log(self.class_count_) - np.log(self.class_count_.sum())
+
+    def joint_log_likelihood(self, X):
+        # the prior is not used by complement naive bayes
+        X = check_features(X, None)
+        return np.asarray(X @ self.feature_log_prob_.T.astype(X.dtype, copy=False))
+
+    def get_parameters_(self):
+      parameters = super().get_parameters_()
+      parameters["norm"] = self.norm
+      return parameters
+
+    def set_parameters_(self, parameters):
+      self.norm = parameters.get("norm", False)
+      super().set_parameters_(parameters)
+
+    def save(self, vocab, filename="ComplementNB"):
+      super().save(vocab, filename)
+
+    def load(self, filepath="ComplementNB.json"):
+      return super().load(filepath)
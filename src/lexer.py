@@ -1,4 +1,6 @@
 from collections import Counter
+from functools import lru_cache
+import numpy as np
 import re
 
 common_prefixes = {
@@ -41,8 +43,12 @@ common_suffixes = {
     "en",   # made of
 }
 
-prefix_pattern = r"^(?:" + "|".join(re.escape(p) for p in common_prefixes) + r")"
-suffix_pattern = r"(?:" + "|".join(re.escape(s) for s in common_suffixes) + r")$"
+def affix_alternation(affixes):
+    # les affixes les plus longs d'abord : "under" est retiré en entier et pas seulement "un"
+    return r"(?:" + "|".join(re.escape(a) for a in sorted(affixes, key=lambda a: (-len(a), a))) + r")"
+
+prefix_pattern = r"^" + affix_alternation(common_prefixes)
+suffix_pattern = affix_alternation(common_suffixes) + r"$"
 
 def word_frequencies(tokens):
     # retourne une liste de paire (token, frequence)
@@ -54,16 +60,65 @@ def top_k(tokens, k = 10):
 
 def remove_stop_words(tokens, stoplist):
     # remove stop_words (Det, Pronoum etc... ) from tokens
-    pattern = r"(?:" + "|".join(re.escape(s) for s in stoplist) + r")"
-    tokens = re.sub(pattern, "", " ".join(tokens)).split()
-    return tokens
+    # stoplist doit être un frozenset construit une fois (voir vectorize.STOP_WORDS) ; seuls les tokens
+    # entiers sont retirés, plus les morceaux de mots
+    if not isinstance(stoplist, (set, frozenset)):
+        stoplist = frozenset(stoplist)
+    return [token for token in tokens if token not in stoplist]
+
+class Stemmer:
+    """
+    Réduit les mots à leur racine en retirant un préfixe puis un suffixe courant.
+    Les regex sont compilées une seule fois et la racine des tokens récents est mémorisée
+    dans un cache LRU borné (cache_size) : sur /predict les tokens viennent des utilisateurs
+    et leur nombre n'est pas borné par le vocabulaire.
+    """
+    def __init__(self, prefixes=common_prefixes, suffixes=common_suffixes, cache_size=100000):
+        self.prefixes = prefixes
+        self.suffixes = suffixes
+        self.cache_size = cache_size
+        self.prefix_re = re.compile(r"^" + affix_alternation(prefixes))
+        self.suffix_re = re.compile(affix_alternation(suffixes) + r"$")
+        self.cached_stem = lru_cache(maxsize=cache_size)(self.stem_uncached)
+
+    def stem_uncached(self, token):
+        return self.suffix_re.sub("", self.prefix_re.sub("", token, count=1), count=1)
+
+    def stem(self, token):
+        return self.cached_stem(token)
+
+    def stem_tokens(self, tokens):
+        # réduire une liste (ou un tableau numpy) de tokens à leurs racines
+        stem = self.cached_stem
+        roots = [stem(token) for token in tokens]
+        if isinstance(tokens, np.ndarray):
+            return np.array(roots, dtype=tokens.dtype if tokens.dtype == object else str)
+        return roots
+
+    def stem_batch(self, tokens_list):
+        # même chose pour les tokens de chaque phrase
+        return [self.stem_tokens(tokens) for tokens in tokens_list]
+
+    def cache_info(self):
+        info = self.cached_stem.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+
+    def clear_cache(self):
+        self.cached_stem.cache_clear()
+
+    def __getstate__(self):
+        # envoyé aux processus sans le cache (lru_cache ne se sérialise pas)
+        return {"prefixes": self.prefixes, "suffixes": self.suffixes, "cache_size": self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+STEMMER = Stemmer()
 
 def stem(token):
     # réduire un mot à sa racine
-    token = re.sub(f"{prefix_pattern}", "", token)
-    token = re.sub(f"{suffix_pattern}", "", token)
-    return token
+    return STEMMER.stem(token)
 
 def stem_tokens(tokens):
     # réduire une liste de tokens à leurs racines
-    return [stem(token) for token in tokens]
+    return STEMMER.stem_tokens(tokens)
@@ -1,14 +1,23 @@
+import hashlib
 import json
+import numpy as np
+import os
 import pandas as pd
 import random
 import re
+import scipy.sparse as sp
+import tempfile
+from tqdm import tqdm
 import vectorize
 
+# bump it when the cleaning or the splitting below change, so that old cached features are not reused
+CACHE_VERSION = 1
 
 
 
 
-def load_clean_data(filePath=None, train_filepath=None, test_filepath=None):
+
+def load_clean_data(filePath=None, train_filepath=None, test_filepath=None, samples_per_class=6000):
     def stratified_sample_dataframe(df, samples_per_class, label_column='label'):
       """
       Samples a DataFrame to get an equal number of samples for each class.
@@ -33,6 +42,14 @@ def load_clean_data(filePath=None, train_filepath=None, test_filepath=None):
       test = pd.read_csv(test_filepath)
       data = pd.concat([train, test])
 
+    data = clean_data(data)
+    #quick_explore(data)
+    if samples_per_class is None:
+      return data   # the whole dataset (the idf is now cheap enough to fit on everything)
+    return stratified_sample_dataframe(data, samples_per_class)   # for the french dataSet
+
+
+def clean_data(data: pd.DataFrame):
     # cleaning
     # remove NaN and dublicate cells
     data.dropna(inplace=True)
@@ -43,8 +60,43 @@ def load_clean_data(filePath=None, train_filepath=None, test_filepath=None):
     data["text"] = data["text"].str.lower()
     data["text"] = data["text"].apply(lambda x: re.sub(r"[^a-z\s]", "", x))
     data["text"] = data["text"].apply(lambda x: re.sub(r"\s+", " ", x))
-    #quick_explore(data)
-    return stratified_sample_dataframe(data, 6000)   # for the french dataSet
+    return data
+
+
+def iter_clean_chunks(filepaths, chunksize=10000):
+    """
+        read one or several csv files chunk by chunk (only chunksize rows in memory at a time)
+        and yield each cleaned chunk (duplicates are only dropped inside a chunk)
+    """
+    if isinstance(filepaths, str):
+      filepaths = [filepaths]
+    for filepath in filepaths:
+      for chunk in pd.read_csv(filepath, usecols=["text", "label"], chunksize=chunksize):
+        chunk = clean_data(chunk)
+        if len(chunk):
+          yield chunk
+
+
+def fit_vectorizer_stream(filepaths, chunksize=10000, vectorizer=None):
+    """
+        first pass: learn the vocab and document frequencies of the csv files chunk by chunk
+    """
+    vectorizer = vectorizer or vectorize.TF_IDF()
+    print("fitting the vectorizer chunk by chunk...")
+    for chunk in tqdm(iter_clean_chunks(filepaths, chunksize)):
+      vectorizer.partial_fit(chunk["text"].to_list())
+    # min_df / max_df / max_features are applied once all the document frequencies are known
+    if hasattr(vectorizer, "prune"):
+      vectorizer.prune()
+    return vectorizer
+
+
+def transform_stream(filepaths, vectorizer, chunksize=10000):
+    """
+        second pass: yield (X_chunk, labels) where X_chunk is the sparse tf-idf block of a chunk
+    """
+    for chunk in iter_clean_chunks(filepaths, chunksize):
+      yield vectorizer.transform(chunk["text"].to_list()), chunk["label"].to_numpy()
 
 
 def quick_explore(data: pd.DataFrame):
@@ -72,11 +124,11 @@ def split_data(dataset: pd.DataFrame, filename=None):
     evidences = dataset["text"].to_list()
 
     # vectorize evidences using BoW or TF-IDF
-    evidences = vectorize.TF_IDF(evidences)
-    #evidences = vectorize.BoW(evidences)
-    vocab = evidences.vocab
-    evidences = evidences.compute_tf_idf_matrix()
-    #evidences = evidences.get_BoW_matrix()
+    vectorizer = vectorize.TF_IDF().fit(evidences)
+    #vectorizer = vectorize.BoW(evidences)
+    vocab = vectorizer.vocab
+    evidences = vectorizer.compute_tf_idf_matrix()
+    #evidences = vectorizer.get_BoW_matrix()
 
     # split dataset into (evidence, label) pairs
     data = [(evidence, label) for evidence, label in zip(evidences, labels)]
@@ -114,10 +166,84 @@ def split_data(dataset: pd.DataFrame, filename=None):
       with open("{}.json".format(filename), "w") as f:
         json.dump(vectors, f)
 
+      # the fitted vocab + idf, reused at serving time instead of refitting on each request
+      vectorizer.save("{}_tfidf".format(filename))
+
 def load_vectors(filepath):
+  # the legacy json stores dense vectors, they are converted to CSR so that training never works on dense X
   with open(filepath, "r") as f:
     vectors = json.load(f)
-  return vectors["vocab"], (vectors["X_train"], vectors["label_train"]), (vectors["X_test"], vectors["label_test"])
+  X_train = sp.csr_matrix(np.asarray(vectors["X_train"], dtype=float))
+  X_test = sp.csr_matrix(np.asarray(vectors["X_test"], dtype=float))
+  return vectors["vocab"], (X_train, vectors["label_train"]), (X_test, vectors["label_test"])
+
+
+def split_sparse(X, labels, ratio=0.8, seed=None):
+    """
+        same 0.8 / 0.2 random split as split_data, but on the rows of a (sparse) matrix
+    """
+    labels = np.asarray(labels)
+    indices = list(range(X.shape[0]))
+    random.Random(seed).shuffle(indices)
+    cut_index = int(ratio * len(indices))
+    train_idx, test_idx = indices[: cut_index], indices[cut_index :]
+    return (X[train_idx], labels[train_idx]), (X[test_idx], labels[test_idx])
+
+
+def file_digest(filepath):
+    # sha256 of the content of a file, read by blocks
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+      for block in iter(lambda: f.read(1 << 20), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(filepaths, vectorizer, **options):
+    # hash of the csv files content, the vectorizer config and the cleaning / split options
+    key = {
+      "version": CACHE_VERSION,
+      "files": [file_digest(filepath) for filepath in filepaths],
+      "vectorizer": type(vectorizer).__name__,
+      "params": vectorizer.get_params(),
+      "options": options
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def load_cached_vectors(vectorizer, filePath=None, train_filepath=None, test_filepath=None,
+                        samples_per_class=6000, seed=42, cache_dir=".feature_cache"):
+    """
+        same output as split_data, with sparse matrices, cached on disk (.npz / .npy files)
+        under a key made of the csv files, the vectorizer config and the options:
+        when nothing changed the features are loaded back instead of being recomputed
+    """
+    filepaths = [filePath] if filePath else [train_filepath, test_filepath]
+    key = cache_key(filepaths, vectorizer, samples_per_class=samples_per_class, seed=seed)
+    directory = os.path.join(cache_dir, key)
+
+    if os.path.isdir(directory):
+      print("loading cached features from {}...".format(directory))
+      vectorizer.load(os.path.join(directory, "vectorizer.json"))
+      return (vectorizer,
+              (sp.load_npz(os.path.join(directory, "X_train.npz")), np.load(os.path.join(directory, "y_train.npy"))),
+              (sp.load_npz(os.path.join(directory, "X_test.npz")), np.load(os.path.join(directory, "y_test.npy"))))
+
+    data = load_clean_data(filePath, train_filepath, test_filepath, samples_per_class)
+    X = vectorizer.fit_transform(data["text"].to_list(), sparse=True)
+    (X_train, y_train), (X_test, y_test) = split_sparse(X, data["label"].to_numpy(), seed=seed)
+
+    # written in a temporary directory then renamed: an interrupted run never leaves a half-written cache
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_directory = tempfile.mkdtemp(dir=cache_dir)
+    sp.save_npz(os.path.join(tmp_directory, "X_train.npz"), X_train, compressed=False)
+    sp.save_npz(os.path.join(tmp_directory, "X_test.npz"), X_test, compressed=False)
+    np.save(os.path.join(tmp_directory, "y_train.npy"), y_train)
+    np.save(os.path.join(tmp_directory, "y_test.npy"), y_test)
+    vectorizer.save(os.path.join(tmp_directory, "vectorizer"))
+    os.replace(tmp_directory, directory)
+
+    return vectorizer, (X_train, y_train), (X_test, y_test)
 
 
 def main():
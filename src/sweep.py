@@ -0,0 +1,146 @@
+# Hyperparameter sweep: trains many configurations of the learning models in a process pool.
+# The feature matrices are written once as .npy files (CSR as data / indices / indptr) and every
+# worker memory-maps them back, so X is never pickled to the processes and its pages are shared
+# through the OS page cache.
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import scipy.sparse as sp
+from tqdm import tqdm
+import learning
+import load_data
+import utils
+import vectorize
+
+MODELS = {
+    "LogisticRegression": learning.LogisticRegression,
+    "GaussianNB": learning.GaussianNB,
+    "MultinomialNB": learning.MultinomialNB,
+    "ComplementNB": learning.ComplementNB,
+}
+
+
+#-------------------------shared matrices-------------------------
+def share_matrix(X, directory, name, dtype=np.float32):
+    """
+        write X in directory: <name>.npy for a dense array, <name>_data/_indices/_indptr.npy for a sparse one
+        return a small (picklable) description used by open_matrix in the workers
+        dtype: float type of the stored values, the one of the models avoids a copy in each worker
+    """
+    path = os.path.join(directory, name)
+    if sp.issparse(X):
+        X = X.tocsr()
+        np.save(path + "_data.npy", X.data.astype(dtype, copy=False))
+        np.save(path + "_indices.npy", X.indices)
+        np.save(path + "_indptr.npy", X.indptr)
+        return {"path": path, "shape": X.shape, "sparse": True}
+    np.save(path + ".npy", np.asarray(X, dtype=dtype))
+    return {"path": path, "shape": np.shape(X), "sparse": False}
+
+
+def open_matrix(shared):
+    # memory-map (read only) a matrix written by share_matrix
+    path = shared["path"]
+    if shared["sparse"]:
+        data, indices, indptr = (np.load("{}_{}.npy".format(path, part), mmap_mode="r")
+                                 for part in ("data", "indices", "indptr"))
+        return sp.csr_matrix((data, indices, indptr), shape=shared["shape"], copy=False)
+    return np.load(path + ".npy", mmap_mode="r")
+
+
+#-------------------------configurations-------------------------
+def param_grid(grid):
+    """
+        {"learning_rate": [0.1, 0.3], "batch_size": [None, 256]} -> the 4 configurations (cartesian product)
+        a list of grids gives the configurations of each grid one after the other
+        the "model" key selects the class in MODELS (LogisticRegression by default)
+    """
+    if isinstance(grid, dict):
+        grid = [grid]
+    configs = []
+    for g in grid:
+        keys = list(g)
+        for values in itertools.product(*(g[key] for key in keys)):
+            configs.append(dict(zip(keys, values)))
+    return configs
+
+
+def fit_evaluate(config, X_train, y_train, X_test, y_test):
+    # train the model described by config and compute the utils metrics on the test set
+    params = dict(config)
+    model = MODELS[params.pop("model", "LogisticRegression")](**params)
+
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_time = time.perf_counter() - start
+
+    y_pred = model.predict(X_test)
+    return {
+        "config": config,
+        "accuracy": utils.accuracy(y_pred, y_test),
+        "precision": utils.precision(y_pred, y_test),
+        "recall": utils.recall(y_pred, y_test),
+        "f1": utils.f1_score(y_pred, y_test),
+        "fit_time": fit_time,
+        "n_iter": getattr(model, "n_iter_", None),
+    }
+
+
+def run_config(config, shared):
+    # worker: train one configuration on the memory-mapped matrices and evaluate it on the test set
+    X_train, X_test = open_matrix(shared["X_train"]), open_matrix(shared["X_test"])
+    return fit_evaluate(config, X_train, shared["y_train"], X_test, shared["y_test"])
+
+
+#-------------------------main-------------------------
+def run_sweep(grid, X_train, y_train, X_test, y_test, n_jobs=-1, dtype=np.float32, tmp_dir=None, verbose=True):
+    """
+        train every configuration of grid (see param_grid) in a pool of n_jobs processes (-1 = all the cores)
+        return one result per configuration (same order): config, accuracy, precision, recall, f1, fit_time, n_iter
+    """
+    configs = param_grid(grid)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, len(configs)) or 1
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as directory:
+        shared = {
+            "X_train": share_matrix(X_train, directory, "X_train", dtype),
+            "X_test": share_matrix(X_test, directory, "X_test", dtype),
+            "y_train": np.asarray(y_train),
+            "y_test": np.asarray(y_test),
+        }
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = executor.map(partial(run_config, shared=shared), configs)
+            results = list(tqdm(results, total=len(configs)) if verbose else results)
+
+    if verbose:
+        print_results(results)
+    return results
+
+
+def print_results(results, metric="f1"):
+    # results sorted from the best to the worst configuration
+    print("=== Sweep ({} configurations, sorted by {}) ===".format(len(results), metric))
+    for result in sorted(results, key=lambda r: r[metric], reverse=True):
+        print(f"{result['f1']:.4f} f1 | {result['accuracy']:.4f} acc | {result['precision']:.4f} prec | "
+              f"{result['recall']:.4f} rec | {result['fit_time']:7.1f}s | {result['config']}")
+
+
+def main():
+    vectorizer, (X_train, y_train), (X_test, y_test) = load_data.load_cached_vectors(
+        vectorize.TF_IDF(), train_filepath="train_df.csv", test_filepath="val_df.csv")
+    grid = [
+        {"learning_rate": [0.1, 0.3, 1.0], "batch_size": [None, 256], "n_iter": [1000], "tol": [1e-5]},
+        {"solver": ["lbfgs"], "n_iter": [200]},
+        {"model": ["GaussianNB"]},
+    ]
+    run_sweep(grid, X_train, y_train, X_test, y_test)
+
+
+if __name__ == "__main__":
+    main()
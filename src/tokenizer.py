@@ -1,4 +1,6 @@
+from collections import OrderedDict
 import re
+import threading
 import unicodedata
 
 # Liste minimale d'abréviations pour éviter les faux split de phrases
@@ -6,25 +8,163 @@ ABBREVIATIONS = {
     "m.", "mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "etc.", "vs."
 }
 
+# regex compilées une seule fois
+SPACES = re.compile(r"\s+")
+WORD_PATTERN = re.compile(r"\w+(?:'\w+)?")                  # mot ou nombre seulement
+WORD_PUNCT_PATTERN = re.compile(r"\w+(?:'\w+)?|[^\w\s]")    # mot, nombre, ou ponctuation
+# mêmes motifs limités à l'ASCII (même résultat, plus rapides) pour les textes ASCII
+ASCII_PATTERNS = {pattern: re.compile(pattern.pattern, re.ASCII) for pattern in (WORD_PATTERN, WORD_PUNCT_PATTERN)}
+
+
+class AccentTable(dict):
+    """
+    Table pour str.translate remplie à la demande : caractère -> sa forme NFKD sans accents
+    (chaque caractère n'est décomposé qu'une fois, ensuite c'est une simple recherche)
+    """
+    def __missing__(self, code):
+        stripped = "".join(ch for ch in unicodedata.normalize("NFKD", chr(code)) if not unicodedata.combining(ch))
+        self[code] = stripped
+        return stripped
+
+ACCENTS = AccentTable()
+
+
 def normalize(text: str, lowercase: bool = True, strip_accents: bool = True) -> str:
     """
     Nettoie le texte : normalisation Unicode, minuscules, accents.
     """
-    # Normalisation unicode
-    text = unicodedata.normalize("NFKD", text)
-
-    # Retirer accents
-    if strip_accents:
-        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    # un texte ASCII est déjà en NFKD et sans accents : rien à faire
+    if not text.isascii():
+        if strip_accents:
+            # normalisation unicode + retrait des accents, caractère par caractère
+            text = text.translate(ACCENTS)
+        else:
+            # Normalisation unicode
+            text = unicodedata.normalize("NFKD", text)
 
     # Minuscule
     if lowercase:
         text = text.lower()
 
     # Retirer espaces multiples
-    text = re.sub(r"\s+", " ", text).strip()
+    return SPACES.sub(" ", text).strip()
+
 
-    return text
+class Tokenizer:
+    """
+    Tokeniseur réutilisable : options et regex préparées une seule fois.
+    - keep_punct : garde ponctuation comme tokens
+    - keep_case : conserve la casse
+    - strip_accents : enlève accents
+    - cache_size : si > 0, cache LRU borné texte -> tokens (textes répétés : retweets,
+      réponses toutes faites...), avec compteurs hits / misses (voir cache_info)
+    """
+    def __init__(self, keep_punct: bool = False, keep_case: bool = False, strip_accents: bool = True,
+                 cache_size: int = 0):
+        self.keep_punct = keep_punct
+        self.keep_case = keep_case
+        self.strip_accents = strip_accents
+        self.pattern = WORD_PUNCT_PATTERN if keep_punct else WORD_PATTERN
+
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()    # le serveur flask peut tokeniser depuis plusieurs threads
+
+    def get_params(self):
+        # les options qui changent les tokens (sans la taille du cache)
+        return {"keep_punct": self.keep_punct, "keep_case": self.keep_case, "strip_accents": self.strip_accents}
+
+    def tokenize(self, text: str) -> list[str]:
+        if self.cache_size > 0:
+            return self.tokenize_batch([text])[0]
+        if not self.keep_case or self.strip_accents:
+            text = normalize(text, lowercase=not self.keep_case, strip_accents=self.strip_accents)
+        return self.pattern.findall(text)
+
+    def tokenize_batch(self, texts) -> list[list[str]]:
+        """
+        Même résultat que tokenize sur chaque texte ; avec un cache, seuls les textes
+        absents du cache sont tokenisés (une fois chacun, même s'ils sont répétés dans le batch)
+        """
+        if self.cache_size <= 0:
+            return self.tokenize_texts(texts)
+
+        texts = list(texts)
+        tokens_list = [None] * len(texts)
+        missing = {}    # texte absent du cache -> ses positions dans le batch
+        with self.lock:
+            for i, text in enumerate(texts):
+                tokens = self.cache.get(text)
+                if tokens is not None:
+                    self.cache.move_to_end(text)
+                    self.hits += 1
+                    tokens_list[i] = list(tokens)
+                elif text in missing:
+                    self.hits += 1
+                    missing[text].append(i)
+                else:
+                    self.misses += 1
+                    missing[text] = [i]
+
+        new_tokens = self.tokenize_texts(missing)
+        with self.lock:
+            for (text, positions), tokens in zip(missing.items(), new_tokens):
+                for i in positions:
+                    tokens_list[i] = list(tokens)
+                # tuple : une entrée du cache ne peut pas être modifiée par l'appelant
+                self.cache[text] = tuple(tokens)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return tokens_list
+
+    def tokenize_texts(self, texts) -> list[list[str]]:
+        """
+        Tokenise un batch sans passer par le cache, en moins de travail par texte :
+        - texte ASCII : pas de NFKD et regex ASCII
+        - accents retirés avec une table de traduction (voir AccentTable)
+        - pas de nettoyage des espaces, les tokens n'en contiennent jamais
+        """
+        findall = self.pattern.findall
+        findall_ascii = ASCII_PATTERNS[self.pattern].findall
+        normalize_text = not self.keep_case or self.strip_accents
+        lowercase = not self.keep_case
+        strip_accents = self.strip_accents
+
+        tokens_list = []
+        for text in texts:
+            if text.isascii():
+                tokens_list.append(findall_ascii(text.lower() if lowercase else text))
+                continue
+            if normalize_text:
+                text = text.translate(ACCENTS) if strip_accents else unicodedata.normalize("NFKD", text)
+                if lowercase:
+                    text = text.lower()
+            tokens_list.append(findall(text))
+        return tokens_list
+
+    def cache_info(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.cache), "maxsize": self.cache_size}
+
+    def clear_cache(self):
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __getstate__(self):
+        # envoyé aux processus de vectorize (n_jobs) sans le verrou ni le contenu du cache
+        state = self.__dict__.copy()
+        state["cache"] = OrderedDict()
+        state["hits"] = state["misses"] = 0
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
 
 
 def tokenize(text: str, keep_punct: bool = False, keep_case: bool = False, strip_accents: bool = True) -> list[str]:
@@ -37,43 +177,43 @@ def tokenize(text: str, keep_punct: bool = False, keep_case: bool = False, strip
     if not keep_case or strip_accents:
         text = normalize(text, lowercase=not keep_case, strip_accents=strip_accents)
 
-    if keep_punct:
-        # Mot, nombre, ou ponctuation
-        pattern = r"\w+(?:'\w+)?|[^\w\s]"
-    else:
-        # Mot ou nombre seulement
-        pattern = r"\w+(?:'\w+)?"
+    pattern = WORD_PUNCT_PATTERN if keep_punct else WORD_PATTERN
+    return pattern.findall(text)
 
-    return re.findall(pattern, text)
 
+SENTENCE_ENDING = re.compile(r"([.!?])\s+")
 
-def sentences(text: str) -> list[str]:
+
+def iter_sentences(text: str):
     """
-    Découpe un texte en phrases en tenant compte des abréviations simples.
+    Découpe un texte en phrases en tenant compte des abréviations simples (générateur).
+    Une seule passe : pour chaque ponctuation, seul le mot qui la précède est regardé.
     """
     # Normalisation légère pour uniformiser espaces
     text = unicodedata.normalize("NFKC", text)
-    text = re.sub(r"\s+", " ", text).strip()
+    text = SPACES.sub(" ", text).strip()
 
     # Découpe sur ponctuation terminale
-    sentence_endings = re.finditer(r"([.!?])\s+", text)
     start = 0
-    sentences_list = []
+    for match in SENTENCE_ENDING.finditer(text):
+        end = match.start(1) + 1
 
-    for match in sentence_endings:
-        end = match.end()
-        part = text[start:end].strip()
-
-        # Vérifie si ça finit par une abréviation connue
-        if part.lower().split()[-1] in ABBREVIATIONS:
+        # Vérifie si ça finit par une abréviation connue (le dernier mot, ponctuation comprise)
+        space = text.rfind(" ", start, end)
+        last_word = text[space + 1 if space != -1 else start : end]
+        if last_word.lower() in ABBREVIATIONS:
             continue
 
-        sentences_list.append(part)
-        start = end
+        yield text[start:end]
+        start = match.end()
 
     # Ajouter dernier segment
     if start < len(text):
-        sentences_list.append(text[start:].strip())
+        yield text[start:]
 
-    return sentences_list
 
+def sentences(text: str) -> list[str]:
+    """
+    Découpe un texte en phrases en tenant compte des abréviations simples.
+    """
+    return list(iter_sentences(text))
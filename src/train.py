@@ -2,13 +2,17 @@ import load_data
 import learning
 import matplotlib.pyplot as plt
 import numpy as np
+import os
 import utils 
 import vectorize
 
 
 #-------------------------------main-----------------------------
 
-def fit_data(filepath=None, train_filepath=None, test_filepath=None, jsonfilepath="vectors.json"):
+def fit_data(filepath=None, train_filepath=None, test_filepath=None, jsonfilepath="vectors.json", vectorizer_filepath="vectors_tfidf.json",
+             cache_dir=".feature_cache", model_path="LogisticRegressionFR.json"):
+    # model_path: where the model is saved, the vectorizer goes next to it as <model>_tfidf.json
+    # (the names app.load_vectorizer looks for)
     
     # import a clean version of the data
     print("Processing the data...")
@@ -16,14 +20,31 @@ def fit_data(filepath=None, train_filepath=None, test_filepath=None, jsonfilepat
 
     # split the data
     #vocab, (X_train, y_train), (X_test, y_test) = load_data.split_data(data)
-    vocab, (X_train, y_train), (X_test, y_test) = load_data.load_vectors(jsonfilepath)
+    if filepath or train_filepath:
+        # sparse features cached on disk, only recomputed when the csv or the vectorizer config change
+        vectorizer, (X_train, y_train), (X_test, y_test) = load_data.load_cached_vectors(
+            vectorize.TF_IDF(), filepath, train_filepath, test_filepath, cache_dir=cache_dir)
+        vocab = vectorizer.vocab
+    else:
+        vocab, (X_train, y_train), (X_test, y_test) = load_data.load_vectors(jsonfilepath)
+        if os.path.exists(vectorizer_filepath):
+            vectorizer = vectorize.TF_IDF().load(vectorizer_filepath)
+        else:
+            # vectors.json written before the vectorizer was saved: only the vocab, neutral idf (as app.py)
+            vectorizer = vectorize.TF_IDF(vocabConnu=vocab)
+            vectorizer.idf_ = np.ones(len(vocab))
     
     # fit data to a model
-    model = learning.LogisticRegression(learning_rate=0.3, n_iter=10000, verbose=True)
+    # stops once the loss has flattened instead of always running the 10000 iterations
+    model = learning.LogisticRegression(learning_rate=0.3, n_iter=10000, verbose=True, tol=1e-5, patience=5)
     #model = learning.GaussianNB()
     model.fit(X_train, y_train)
+    print(f"stopped after {model.n_iter_} iterations")
     print("saving...")
-    model.save(vocab, "LogisticRegression")
+    model_name = os.path.splitext(model_path)[0]
+    model.save(vocab, model_name)
+    # keep the fitted vectorizer (vocab + idf) next to the model for app.py
+    vectorizer.save(model_name + "_tfidf")
     y_pred = model.predict(X_test)
     probs = model.predict_proba(X_test)
     evaluate(model, y_pred, probs, y_test)
@@ -1,7 +1,17 @@
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import json
+import os
+import zlib
 from lexer import stem_tokens, remove_stop_words
-import math
+import numpy as np
+from scipy.sparse import csr_matrix
 from tqdm import tqdm
-from tokenizer import tokenize, sentences
+from tokenizer import Tokenizer, normalize, iter_sentences
+
+TOKENIZER = Tokenizer()
 
 STOPSWORDS = ['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its', 'itself', 
               'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an',
@@ -10,118 +20,542 @@ STOPSWORDS = ['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you'
               'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 
               'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"]
 
-class BoW:
-    def __init__(self, corpus, vocabConnu = None):
-        #self.corpus = sentences(corpus)    # if corpus is not a list of sentence
-        self.corpus = corpus
-        self.tokens_list = []
-        # get tokens for each sentence in corpus
+STOPSWORDS_FR = ['au', 'aux', 'avec', 'ce', 'ces', 'dans', 'de', 'des', 'du', 'elle', 'en', 'et', 'eux', 'il', 'ils', 'je', 'la', 'le', 'les', 'leur', 'lui', 'ma', 'mais', 'me', 'même', 'mes', 'moi',
+                 'mon', 'ne', 'nos', 'notre', 'nous', 'on', 'ou', 'par', 'pas', 'pour', 'qu', 'que', 'qui', 'sa', 'se', 'ses', 'son', 'sur', 'ta', 'te', 'tes', 'toi', 'ton', 'tu', 'un', 'une', 'vos', 'votre', 'vous',
+                 'c', 'd', 'j', 'l', 'à', 'm', 'n', 's', 't', 'y', 'été', 'étée', 'étées', 'étés', 'étant', 'étante', 'étants', 'étantes', 'suis', 'es', 'est', 'sommes', 'êtes', 'sont', 'serai', 'seras',
+                 'sera', 'serons', 'serez', 'seront', 'serais', 'serait', 'serions', 'seriez', 'seraient', 'étais', 'était', 'étions', 'étiez', 'étaient', 'fus', 'fut', 'fûmes', 'fûtes', 'furent', 'sois',
+                 'soit', 'soyons', 'soyez', 'soient', 'fusse', 'fusses', 'fût', 'fussions', 'fussiez', 'fussent', 'ayant', 'ayante', 'ayantes', 'ayants', 'eu', 'eue', 'eues', 'eus', 'ai', 'as', 'avons',
+                 'avez', 'ont', 'aurai', 'auras', 'aura', 'aurons', 'aurez', 'auront', 'aurais', 'aurait', 'aurions', 'auriez', 'auraient', 'avais', 'avait', 'avions', 'aviez', 'avaient', 'eut', 'eûmes',
+                 'eûtes', 'eurent', 'aie', 'aies', 'ait', 'ayons', 'ayez', 'aient', 'eusse', 'eusses', 'eût', 'eussions', 'eussiez', 'eussent']
+
+# stop words par langue (comme nos deux modèles FR / EN), construits une seule fois
+# et normalisés comme les tokens (minuscules, sans accents)
+STOP_WORDS = {
+    "en": frozenset(normalize(word) for word in STOPSWORDS),
+    "fr": frozenset(normalize(word) for word in STOPSWORDS_FR),
+}
+
+
+def get_stop_words(stop_words):
+    # stop_words : None, une langue de STOP_WORDS ("en", "fr") ou une liste de mots
+    if stop_words is None:
+        return None
+    if isinstance(stop_words, str):
+        if stop_words not in STOP_WORDS:
+            raise ValueError("Unknown stop words language: {}".format(stop_words))
+        return STOP_WORDS[stop_words]
+    return frozenset(normalize(word) for word in stop_words)
+
+
+def stop_words_config(stop_words):
+    # stop_words sous une forme qu'on peut sauvegarder en json
+    if stop_words is None or isinstance(stop_words, str):
+        return stop_words
+    return sorted(stop_words)
+
+
+def word_ngrams(tokens, ngram_range=(1, 1)):
+    # les n-grammes de mots de tokens pour n dans [min_n, max_n] (les unigrammes sont les tokens)
+    min_n, max_n = ngram_range
+    if max_n == 1:
+        return tokens
+    ngrams = list(tokens) if min_n == 1 else []
+    for n in range(max(min_n, 2), max_n + 1):
+        ngrams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return ngrams
+
+
+def char_ngrams(tokens, ngram_range=(2, 4)):
+    # n-grammes de caractères à l'intérieur de chaque mot entouré d'espaces (robustes aux fautes de frappe)
+    min_n, max_n = ngram_range
+    ngrams = []
+    for token in tokens:
+        word = " " + token + " "
+        for n in range(min_n, max_n + 1):
+            ngrams.extend(word[i:i + n] for i in range(len(word) - n + 1))
+    return ngrams
+
+
+def analyze(tokens, ngram_range=(1, 1), analyzer="word"):
+    """
+    Transforme les tokens d'une phrase en features
+    - analyzer : "word" (n-grammes de mots) ou "char_wb" (n-grammes de caractères dans les mots)
+    """
+    if analyzer == "word":
+        return word_ngrams(tokens, ngram_range)
+    if analyzer == "char_wb":
+        return char_ngrams(tokens, ngram_range)
+    raise ValueError("Unknown analyzer: {}".format(analyzer))
+
+
+def document_frequencies(tokens_list, vocab_index):
+    # nombre de documents contenant chaque mot du vocabulaire, en une passe sur les mots uniques
+    df = np.zeros(len(vocab_index), dtype=np.int64)
+    for tokens in tokens_list:
+        cols = [vocab_index[word] for word in set(tokens) if word in vocab_index]
+        df[cols] += 1
+    return df
+
+
+def prune_vocab(df, n_docs, min_df=1, max_df=1.0, max_features=None):
+    """
+    Retourne les indices (dans l'ordre du vocabulaire) des mots gardés
+    - min_df / max_df : entier = nombre de documents, réel = proportion des documents
+    - max_features : garde seulement les max_features mots les plus fréquents (en df)
+    """
+    min_count = min_df if isinstance(min_df, int) else min_df * n_docs
+    max_count = max_df if isinstance(max_df, int) else max_df * n_docs
+    keep = np.flatnonzero((df >= min_count) & (df <= max_count))
+    if max_features is not None and keep.size > max_features:
+        # tri stable : à df égal, le mot vu en premier est gardé
+        keep = np.sort(keep[np.argsort(-df[keep], kind="stable")[:max_features]])
+    return keep
+
+
+def tokenize_sentences(corpus, ngram_range=(1, 1), analyzer="word", tokenizer=None, stop_words=None, stem=False):
+    """
+    Retourne les tokens (ou n-grammes, voir analyze) de chaque phrase d'une liste de phrases
+    et le vocabulaire de ce morceau (ordre de première apparition)
+    - tokenizer : un tokenizer.Tokenizer (options, cache), TOKENIZER par défaut
+    - stop_words : frozenset de mots retirés (voir get_stop_words)
+    - stem : réduit chaque token à sa racine (lexer.stem_tokens, mémorisé par token)
+    """
+    tokens_list = []
+    vocab = {}
+    for sentence_token in (tokenizer or TOKENIZER).tokenize_batch(corpus):
+
+        # remove stops_words from sentence 
+        if stop_words:
+            sentence_token = remove_stop_words(sentence_token, stop_words)
+
+        # compress each token of sentence_token to its radical
+        if stem:
+            sentence_token = stem_tokens(sentence_token)
+
+        sentence_token = analyze(sentence_token, ngram_range, analyzer)
+        tokens_list.append(sentence_token)
+        vocab.update(dict.fromkeys(sentence_token))
+    return tokens_list, list(vocab)
+
+
+def tokenize_corpus(corpus, verbose=True, n_jobs=1, return_vocab=False, **options):
+    """
+    Retourne la liste des tokens de chaque phrase du corpus
+    - corpus : texte brut (découpé en phrases) ou liste de phrases
+    - n_jobs : nombre de processus (-1 = tous les coeurs) ; le corpus est découpé en morceaux
+      tokenisés en parallèle puis remis dans l'ordre, le résultat est le même qu'avec n_jobs=1
+    - return_vocab : retourne aussi le vocabulaire (ordre de première apparition)
+    - options : ngram_range, analyzer, tokenizer, stop_words, stem (voir tokenize_sentences)
+    """
+    if isinstance(corpus, str):
+        corpus = iter_sentences(corpus)
+    corpus = list(corpus)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, len(corpus)) or 1
+
+    # get tokens for each sentence in corpus
+    if verbose:
         print("getting tokens for each sentence in the corpus...")
-        for sentence in tqdm(self.corpus):
-          sentence_token = tokenize(sentence)
-          #print(sentence_token)-----------debug
+    if n_jobs == 1:
+        tokens_list, vocab = tokenize_sentences(tqdm(corpus) if verbose else corpus, **options)
+    else:
+        # quelques morceaux par processus pour équilibrer la charge
+        chunksize = -(-len(corpus) // (4 * n_jobs))
+        chunks = [corpus[i:i + chunksize] for i in range(0, len(corpus), chunksize)]
+        tokens_list, vocab = [], {}
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = executor.map(partial(tokenize_sentences, **options), chunks)
+            for chunk_tokens, chunk_vocab in (tqdm(results, total=len(chunks)) if verbose else results):
+                # fusion dans l'ordre des morceaux : même vocabulaire qu'en séquentiel
+                tokens_list.extend(chunk_tokens)
+                vocab.update(dict.fromkeys(chunk_vocab))
+        vocab = list(vocab)
 
-          # remove stops_words from sentence 
-          #sentence_token = remove_stop_words(sentence_token, STOPSWORDS)
-          #print(sentence_token)
+    if return_vocab:
+        return tokens_list, vocab
+    return tokens_list
 
-          # compress each token of sentence_token to its radical
-          #sentence_token = stem_tokens(sentence_token)
 
-          self.tokens_list.append(sentence_token)
+class BoW:
+    def __init__(self, corpus, vocabConnu = None, n_jobs=1, ngram_range=(1, 1), analyzer="word",
+                 min_df=1, max_df=1.0, max_features=None, tokenizer=None, stop_words=None, stem=False):
+        #self.corpus = sentences(corpus)    # if corpus is not a list of sentence
+        self.corpus = corpus
+        # get tokens for each sentence in corpus and the list of vocabulary
+        self.tokens_list, vocab = tokenize_corpus(self.corpus, n_jobs=n_jobs, return_vocab=True,
+                                                  ngram_range=ngram_range, analyzer=analyzer, tokenizer=tokenizer,
+                                                  stop_words=get_stop_words(stop_words), stem=stem)
 
         #print(self.tokens_list)--------debug
         
         if vocabConnu:
             self.vocab = vocabConnu
         else:
-            # get the list of vocabulary for the given list of tokens
-            vocab = set()
-            print("getting the list of vocabulary...")
-            for token in tqdm(self.tokens_list):
-                vocab.update(token)
-            self.vocab = list(vocab)
+            self.vocab = vocab
             #print("vocab: ", self.vocab)
+
+        # index mot -> colonne de la matrice
+        self.vocab_index = {word: i for i, word in enumerate(self.vocab)}
+
+        if not vocabConnu and (min_df != 1 or max_df != 1.0 or max_features is not None):
+            # on ne garde que les mots assez (et pas trop) fréquents
+            df = document_frequencies(self.tokens_list, self.vocab_index)
+            keep = prune_vocab(df, len(self.tokens_list), min_df, max_df, max_features)
+            self.vocab = [self.vocab[i] for i in keep]
+            self.vocab_index = {word: i for i, word in enumerate(self.vocab)}
     
-    def get_BoW_matrix(self):
-        matrix = []
+    def get_BoW_matrix(self, dtype=None, sparse=False):
+        """
+        Compte les mots de chaque phrase en une passe (Counter) : O(nombre total de tokens)
+        - dtype : si donné (ex: np.uint16, np.uint32), retourne un tableau numpy de ce type
+        - sparse : retourne une matrice scipy CSR (n_phrases x n_vocab)
+        """
         print("computing the BoW_matrix...")
+        indptr = array("i", [0])
+        indices = array("i")
+        data = array("i")
         for tokens in tqdm(self.tokens_list):
-            vec = [tokens.count(word) for word in self.vocab]
-            matrix.append(vec)
-        return matrix
+            for word, count in Counter(tokens).items():
+                col = self.vocab_index.get(word)
+                if col is None:     # mot absent du vocabulaire connu
+                    continue
+                indices.append(col)
+                data.append(count)
+            indptr.append(len(indices))
+
+        matrix = csr_matrix((np.frombuffer(data, dtype=np.int32).astype(dtype or np.int64),
+                             np.frombuffer(indices, dtype=np.int32),
+                             np.frombuffer(indptr, dtype=np.int32)),
+                            shape=(len(self.tokens_list), len(self.vocab)))
+        if sparse:
+            return matrix
+        if dtype is not None:
+            return matrix.toarray()
+        return matrix.toarray().tolist()
     
 
 class TF_IDF:
-    def __init__(self, corpus, vocabConnu = None):
-        self.corpus = sentences(corpus)    # if sentence is not a list of sentence
-        #self.corpus = corpus
-        #print(self.corpus)
+    def __init__(self, corpus=None, vocabConnu = None, n_jobs=1, ngram_range=(1, 1), analyzer="word",
+                 min_df=1, max_df=1.0, max_features=None, norm=None, tokenizer=None, stop_words=None, stem=False):
+        self.n_jobs = n_jobs
+        self.tokenizer = tokenizer or Tokenizer()
+        self.stop_words = stop_words    # None, "en", "fr" ou une liste de mots
+        self.stem = stem
+        self.norm = norm    # None ou "l2" : normalise chaque ligne de la matrice tf-idf
+        self.ngram_range = tuple(ngram_range)
+        self.analyzer = analyzer
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_features = max_features
         self.tokens_list = []
-        # get tokens for each sentence in corpus
-        print("getting tokens for each sentence in the corpus...")
-        for sentence in tqdm(self.corpus):
-          sentence_token = tokenize(sentence)
+        self.vocab = []
+        self.vocab_index = {}
+        self.idf_ = None    # appris par fit() ou chargé par load()
+        self.df_ = None     # document frequencies accumulées par fit() / partial_fit()
+        self.n_docs_ = 0
 
-          # remove stops_words from sentence 
-          #sentence_token = remove_stop_words(sentence_token, STOPSWORDS)
+        if corpus is not None:
+            self.tokens_list, vocab = tokenize_corpus(corpus, n_jobs=n_jobs, return_vocab=True, **self.token_options())
 
-          # compress each token of sentence_token to its radical
-          #sentence_token = stem_tokens(sentence_token)
+        if vocabConnu:
+            self.set_vocab(vocabConnu)
+        elif corpus is not None:
+            self.set_vocab(vocab)
+            if min_df != 1 or max_df != 1.0 or max_features is not None:
+                # comme BoW : on ne garde que les mots assez (et pas trop) fréquents
+                df = document_frequencies(self.tokens_list, self.vocab_index)
+                keep = prune_vocab(df, len(self.tokens_list), min_df, max_df, max_features)
+                self.set_vocab([self.vocab[i] for i in keep])
 
-          self.tokens_list.append(sentence_token)
+    def token_options(self):
+        # options de tokenize_corpus propres à ce vectorizer
+        return {"ngram_range": self.ngram_range, "analyzer": self.analyzer, "tokenizer": self.tokenizer,
+                "stop_words": get_stop_words(self.stop_words), "stem": self.stem}
 
-        #print(self.tokens_list)
-        
-        if vocabConnu:
-            self.vocab = vocabConnu
-        else:
-            # get the list of vocabulary for the given list of tokens
-            print("constructing the list of vocabulary...")
-            self.vocab = set()
-            for tokens in tqdm(self.tokens_list):
-                self.vocab.update(tokens)
-            self.vocab = list(self.vocab)
-            #print("vocab: ", self.vocab)
+    def set_vocab(self, vocab):
+        self.vocab = list(vocab)
+        # index mot -> colonne de la matrice
+        self.vocab_index = {word: i for i, word in enumerate(self.vocab)}
 
-    def compute_tf(self, tokens):
+    def fit(self, corpus):
+        """
+        Apprend une seule fois le vocabulaire et l'idf sur le corpus d'entraînement
+        """
+        self.tokens_list = tokenize_corpus(corpus, n_jobs=self.n_jobs, **self.token_options())
+        self.set_vocab([])
+        self.df_ = None
+        self.n_docs_ = 0
+        return self.update_idf(self.tokens_list).prune()
+
+    def partial_fit(self, corpus):
+        """
+        Met à jour le vocabulaire, les df et l'idf avec un morceau du corpus, sans garder ses tokens :
+        la mémoire dépend de la taille du morceau et du vocabulaire, pas de tout le corpus
+        """
+        tokens_list = tokenize_corpus(corpus, verbose=False, n_jobs=self.n_jobs, **self.token_options())
+        return self.update_idf(tokens_list)
+
+    def prune(self):
+        """
+        Applique min_df / max_df / max_features au vocabulaire appris (à appeler après le dernier
+        partial_fit) : le vocabulaire sauvegardé pour le serveur ne contient que les mots gardés
+        """
+        keep = prune_vocab(self.df_, self.n_docs_, self.min_df, self.max_df, self.max_features)
+        if keep.size < len(self.vocab):
+            self.set_vocab([self.vocab[i] for i in keep])
+            self.df_ = self.df_[keep]
+            self.idf_ = self.idf_[keep]
+        return self
+
+    def update_idf(self, tokens_list):
+        # ajoute les nouveaux mots au vocabulaire (ordre de première apparition) et compte leurs df
+        cols = array("i")
+        for tokens in tokens_list:
+            for word in dict.fromkeys(tokens):
+                col = self.vocab_index.get(word)
+                if col is None:
+                    col = self.vocab_index[word] = len(self.vocab)
+                    self.vocab.append(word)
+                cols.append(col)
+
+        df = np.bincount(np.frombuffer(cols, dtype=np.int32), minlength=len(self.vocab))
+        if self.df_ is not None:
+            df[:len(self.df_)] += self.df_
+        self.df_ = df
+        self.n_docs_ += len(tokens_list)
+        self.idf_ = np.log(self.n_docs_ / (1 + self.df_)) + 1  # +1 pour éviter log(0)
+        return self
+
+    def transform(self, texts, sparse=True):
+        """
+        Vectorise de nouveaux textes avec le vocabulaire et l'idf appris par fit() / load() :
+        seulement la tokenisation et un lookup creux, l'idf n'est pas recalculé
+        """
+        tokens_list = tokenize_corpus(texts, verbose=False, n_jobs=self.n_jobs, **self.token_options())
+        matrix = self.compute_sparse_tf_idf_matrix(self.idf_, tokens_list, verbose=False)
+        return matrix if sparse else matrix.toarray().tolist()
+
+    def fit_transform(self, corpus, sparse=False):
+        return self.fit(corpus).compute_tf_idf_matrix(sparse)
+
+    def compute_tf(self, tokens_list):
         """
         TF pour une phrase donnée = fréquence du mot / nombre total de mots
+        Seuls les mots présents dans la phrase (et dans le vocabulaire) sont calculés :
+        retourne les triplets (lignes, colonnes, tf) de tout le batch en tableaux numpy
         """
-        tf = {}
-        total_tokens = len(tokens)
-        for word in self.vocab:
-            tf[word] = tokens.count(word) / total_tokens if total_tokens > 0 else 0
-        return tf
+        rows = array("i")
+        cols = array("i")
+        counts = array("d")
+        total_tokens = array("d")
+        for row, tokens in enumerate(tokens_list):
+            for word, count in Counter(tokens).items():
+                col = self.vocab_index.get(word)
+                if col is None:     # mot absent du vocabulaire connu
+                    continue
+                rows.append(row)
+                cols.append(col)
+                counts.append(count)
+            total_tokens.append(len(tokens))
+
+        rows = np.frombuffer(rows, dtype=np.int32)
+        cols = np.frombuffer(cols, dtype=np.int32)
+        tf = np.frombuffer(counts, dtype=np.float64) / np.frombuffer(total_tokens, dtype=np.float64)[rows]
+        return rows, cols, tf
 
     def compute_idf(self):
         """
         IDF pour chaque mot = log(N / (1 + df))
         - N = nombre total de documents
         - documentFrequency (df) = nombre de documents contenant ce mot
+        Les df sont accumulés en une passe sur les mots uniques de chaque document.
+        Retourne un tableau numpy aligné sur vocab_index (idf[vocab_index[word]])
         """
         N = len(self.tokens_list)
-        idf = {}
-        for word in tqdm(self.vocab):
-            df = sum(1 for tokens in self.tokens_list if word in tokens)
-            idf[word] = math.log(N / (1 + df)) + 1  # +1 pour éviter log(0)
-        return idf
+        df = document_frequencies(tqdm(self.tokens_list), self.vocab_index)
+        return np.log(N / (1 + df)) + 1  # +1 pour éviter log(0)
 
-    def compute_tf_idf_matrix(self):
+    def compute_tf_idf_matrix(self, sparse=False):
         """
         Retourne une matrice TF-IDF (liste de vecteurs)
+        - sparse : retourne une matrice scipy CSR (n_phrases x n_vocab) à la place,
+          dont la taille dépend du nombre de tokens non nuls et pas de vocab x documents
         """
         print("computing tf-idf matrix...")
-        idf = self.compute_idf()
+        idf = self.idf_ if self.idf_ is not None else self.compute_idf()
         print()
-        matrix = []
-        print("computing tf for each sentence(list of token)...")
-        for tokens in tqdm(self.tokens_list):
-            tf = self.compute_tf(tokens)
-            vec = [tf[word] * idf[word] for word in self.vocab]
-            matrix.append(vec)
-        return matrix
+        matrix = self.compute_sparse_tf_idf_matrix(idf)
+        return matrix if sparse else matrix.toarray().tolist()
+
+    def compute_sparse_tf_idf_matrix(self, idf, tokens_list=None, verbose=True):
+        """
+        Construit la matrice TF-IDF au format CSR à partir des triplets de compute_tf :
+        l'idf est appliqué (et les lignes normalisées si norm="l2") en une opération numpy par batch
+        """
+        if tokens_list is None:
+            tokens_list = self.tokens_list
+        if verbose:
+            print("computing tf for each sentence(list of token)...")
+            tokens_list = tqdm(tokens_list)
+        rows, cols, tf = self.compute_tf(tokens_list)
+        n_rows = len(tokens_list)
+
+        data = tf * idf[cols]
+        if self.norm == "l2":
+            norms = np.sqrt(np.bincount(rows, weights=data**2, minlength=n_rows))
+            data /= norms[rows]
+
+        # les lignes sont déjà triées : indptr = nombre cumulé de mots par phrase
+        indptr = np.zeros(n_rows + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+        return csr_matrix((data, cols, indptr), shape=(n_rows, len(self.vocab)))
+
+    def get_params(self):
+        # la configuration qui détermine les features (clé du cache de load_data)
+        return {
+            "ngram_range": list(self.ngram_range),
+            "analyzer": self.analyzer,
+            "tokenizer": self.tokenizer.get_params(),
+            "stop_words": stop_words_config(self.stop_words),
+            "stem": self.stem,
+            "min_df": self.min_df,
+            "max_df": self.max_df,
+            "max_features": self.max_features,
+            "norm": self.norm
+        }
+
+    def save(self, filename):
+      # le vocabulaire (déjà élagué) et l'idf appris, à charger à côté du modèle
+      parameters = {
+        "vocab": self.vocab,
+        "idf": self.idf_.tolist(),
+        "ngram_range": list(self.ngram_range),
+        "analyzer": self.analyzer,
+        "tokenizer": self.tokenizer.get_params(),
+        "stop_words": stop_words_config(self.stop_words),
+        "stem": self.stem,
+        "norm": self.norm
+      }
+
+      # save to a json file 
+      with open("{}.json".format(filename), "w") as f:
+        json.dump(parameters, f)
+
+    def load(self, filepath):
+      with open(filepath, "r") as f:
+          parameters = json.load(f)
+
+      self.set_vocab(parameters["vocab"])
+      self.idf_ = np.array(parameters["idf"])
+      self.ngram_range = tuple(parameters.get("ngram_range", (1, 1)))
+      self.analyzer = parameters.get("analyzer", "word")
+      # mêmes options de tokenisation qu'à l'entraînement, en gardant la taille de cache choisie
+      self.tokenizer = Tokenizer(**parameters.get("tokenizer", {}), cache_size=self.tokenizer.cache_size)
+      self.stop_words = parameters.get("stop_words")
+      self.stem = parameters.get("stem", False)
+      self.norm = parameters.get("norm")
+      return self
+
+
+
+class HashingVectorizer:
+    """
+    Vectoriseur sans vocabulaire : chaque token (ou n-gramme) va dans une des n_features colonnes
+    d'après un hash stable (crc32, identique d'une exécution à l'autre, contrairement à hash()).
+    - alternate_sign : le signe du compte dépend aussi du hash, pour que les collisions se compensent
+    Rien n'est appris : seule la configuration est sauvegardée à côté du modèle.
+    """
+    def __init__(self, n_features=2**16, ngram_range=(1, 1), alternate_sign=True, n_jobs=1, analyzer="word",
+                 tokenizer=None, stop_words=None, stem=False):
+        self.n_features = n_features
+        self.tokenizer = tokenizer or Tokenizer()
+        self.stop_words = stop_words    # None, "en", "fr" ou une liste de mots
+        self.stem = stem
+        self.ngram_range = tuple(ngram_range)
+        self.analyzer = analyzer
+        self.alternate_sign = alternate_sign
+        self.n_jobs = n_jobs
+
+    def token_options(self):
+        # options de tokenize_corpus propres à ce vectorizer
+        return {"ngram_range": self.ngram_range, "analyzer": self.analyzer, "tokenizer": self.tokenizer,
+                "stop_words": get_stop_words(self.stop_words), "stem": self.stem}
+
+    def fit(self, corpus=None):
+        # rien à apprendre, présent pour avoir la même interface que TF_IDF
+        return self
+
+    def partial_fit(self, corpus=None):
+        return self
+
+    def transform(self, texts, sparse=True):
+        """
+        Retourne la matrice CSR (n_phrases x n_features) des comptes hachés
+        """
+        tokens_list = tokenize_corpus(texts, verbose=False, n_jobs=self.n_jobs, **self.token_options())
+        indptr = array("i", [0])
+        indices = array("i")
+        data = array("d")
+        for tokens in tokens_list:
+            for feature, count in Counter(tokens).items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                indices.append(h % self.n_features)
+                data.append(-count if self.alternate_sign and h & 0x80000000 else count)
+            indptr.append(len(indices))
+
+        matrix = csr_matrix((np.frombuffer(data, dtype=np.float64),
+                             np.frombuffer(indices, dtype=np.int32),
+                             np.frombuffer(indptr, dtype=np.int32)),
+                            shape=(len(indptr) - 1, self.n_features))
+        # plusieurs features d'une phrase peuvent tomber dans la même colonne
+        matrix.sum_duplicates()
+        matrix.eliminate_zeros()
+        return matrix if sparse else matrix.toarray().tolist()
+
+    def fit_transform(self, corpus, sparse=True):
+        return self.fit(corpus).transform(corpus, sparse)
+
+    def get_params(self):
+        # la configuration qui détermine les features (clé du cache de load_data)
+        return {
+            "n_features": self.n_features,
+            "ngram_range": list(self.ngram_range),
+            "analyzer": self.analyzer,
+            "tokenizer": self.tokenizer.get_params(),
+            "stop_words": stop_words_config(self.stop_words),
+            "stem": self.stem,
+            "alternate_sign": self.alternate_sign
+        }
+
+    def save(self, filename):
+      parameters = {
+        "n_features": self.n_features,
+        "ngram_range": list(self.ngram_range),
+        "analyzer": self.analyzer,
+        "tokenizer": self.tokenizer.get_params(),
+        "stop_words": stop_words_config(self.stop_words),
+        "stem": self.stem,
+        "alternate_sign": self.alternate_sign
+      }
+
+      # save to a json file 
+      with open("{}.json".format(filename), "w") as f:
+        json.dump(parameters, f)
+
+    def load(self, filepath):
+      with open(filepath, "r") as f:
+          parameters = json.load(f)
 
+      self.n_features = parameters["n_features"]
+      self.ngram_range = tuple(parameters["ngram_range"])
+      self.analyzer = parameters.get("analyzer", "word")
+      # mêmes options de tokenisation qu'à l'entraînement, en gardant la taille de cache choisie
+      self.tokenizer = Tokenizer(**parameters.get("tokenizer", {}), cache_size=self.tokenizer.cache_size)
+      self.stop_words = parameters.get("stop_words")
+      self.stem = parameters.get("stem", False)
+      self.alternate_sign = parameters["alternate_sign"]
+      return self
 
     
 def main():